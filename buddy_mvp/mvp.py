@@ -24,13 +24,13 @@ import json
 import win32gui
 import win32con
 import win32api
-from PIL import ImageGrab
+from PIL import Image, ImageGrab
 from win10toast import ToastNotifier
 from winrt.windows.media.ocr import OcrEngine
 from winrt.windows.graphics.imaging import BitmapPixelFormat, SoftwareBitmap
 from winrt.windows.storage.streams import Buffer
 import winsound
-from buddy_mvp import llm
+from buddy_mvp import llm, preprocess
 from dotenv import load_dotenv
 from ctypes import Structure, c_uint, sizeof, windll, byref
 
@@ -125,9 +125,13 @@ except ImportError:  # pragma: no cover – colourama optional
     _CLR = {k: "" for k in ("interval", "window-change", "screen-change", "error", "llm", "summary", "hint")}
     _RESET = ""
 
-# Returns screenshot PIL.Image and window title
-def grab_active_window() -> tuple[Any, str]:
-    """Capture a screenshot of the currently active window across all monitors."""
+# Returns screenshot PIL.Image, window title and client-area box
+def grab_active_window() -> tuple[Any, str, tuple[int, int, int, int] | None]:
+    """Capture a screenshot of the currently active window across all monitors.
+
+    The third value is the window's client area (no title bar or borders)
+    relative to the screenshot, or ``None`` if it could not be determined.
+    """
     hwnd = win32gui.GetForegroundWindow()
     # Get window rectangle in virtual-screen coordinates (may include negatives)
     left, top, right, bottom = win32gui.GetWindowRect(hwnd)
@@ -139,7 +143,14 @@ def grab_active_window() -> tuple[Any, str]:
         full = ImageGrab.grab()
         img = full.crop((left, top, right, bottom))
     title = win32gui.GetWindowText(hwnd)
-    return img, title
+    client_box = None
+    try:
+        _, _, cw, ch = win32gui.GetClientRect(hwnd)
+        cx, cy = win32gui.ClientToScreen(hwnd, (0, 0))
+        client_box = (cx - left, cy - top, cx - left + cw, cy - top + ch)
+    except Exception:
+        pass
+    return img, title, client_box
 
 
 def pil_to_software_bitmap(img):
@@ -158,8 +169,8 @@ def pil_to_software_bitmap(img):
     )
 
 
-def extract_text(img) -> str:
-    """Use Windows built in OCR to extract text from a PIL image."""
+def recognize_lines(img) -> list[tuple[str, tuple[int, int, int, int]]]:
+    """Run Windows OCR on a PIL image and return ``(text, box)`` per line."""
     engine = OcrEngine.try_create_from_user_profile_languages()
     bitmap = pil_to_software_bitmap(img)
 
@@ -171,8 +182,82 @@ def extract_text(img) -> str:
         return await engine.recognize_async(bitmap)  # type: ignore[attr-defined]
 
     result = asyncio.run(_recognize())
-    lines = [line.text for line in result.lines]
-    return " ".join(lines)
+    lines = []
+    for line in result.lines:
+        rects = [w.bounding_rect for w in line.words]
+        if rects:
+            box = (
+                int(min(r.x for r in rects)),
+                int(min(r.y for r in rects)),
+                int(max(r.x + r.width for r in rects)),
+                int(max(r.y + r.height for r in rects)),
+            )
+        else:
+            box = (0, 0, 0, 0)
+        lines.append((line.text, box))
+    return lines
+
+
+def extract_text(img) -> str:
+    """Use Windows built in OCR to extract text from a PIL image."""
+    return " ".join(text for text, _ in recognize_lines(img))
+
+
+def bench_ocr(folder: Path, pre_cfg: dict, limit: int = 20) -> None:
+    """Print OCR time and text length for saved screenshots, raw vs. preprocessed.
+
+    Window titles are looked up in ``ocr.jsonl`` (written by ``--log-json``)
+    so ignore regions and glyph estimates apply per application.  The
+    client-area crop is not exercised (no window rectangle is stored) and
+    region learning is disabled.  "pre ms" includes the preprocessing itself.
+    """
+    files = sorted(folder.glob("*.png"))[-limit:]
+    if not files:
+        print(f"No PNG files found in {folder}")
+        return
+    titles: dict[str, str] = {}
+    json_path = Path(__file__).with_name("ocr.jsonl")
+    if json_path.exists():
+        with json_path.open(encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    rec = json.loads(line)
+                    titles[rec["screenshot"]] = rec.get("title", "")
+                except (ValueError, KeyError, TypeError):
+                    continue
+    pre = preprocess.Preprocessor({**pre_cfg, "learn_regions": False})
+    print("Note: client-area crop not measured (screenshots have no window metadata).")
+    # Warm up the OCR engine so the first raw run doesn't absorb the
+    # WinRT/asyncio cold-start cost.
+    recognize_lines(Image.open(files[0]))
+    tot_raw_ms = tot_pre_ms = 0.0
+    tot_raw_len = tot_pre_len = 0
+    print(f"{'file':40s} {'raw ms':>8s} {'pre ms':>8s} {'raw chars':>10s} {'pre chars':>10s}")
+    for f in files:
+        img = Image.open(f)
+        title = titles.get(f.name)
+        if title is None:
+            print(f"Warning: no ocr.jsonl record for {f.name}; ignore regions not applied")
+            title = ""
+        t0 = time.perf_counter()
+        raw_lines = recognize_lines(img)
+        raw_ms = (time.perf_counter() - t0) * 1000
+        # Seed the glyph-height estimate the way the live loop would after
+        # its first OCR cycle.
+        pre.observe(title, raw_lines, preprocess.Frame(0, 0, 1.0, img.size))
+        t0 = time.perf_counter()
+        prepared, _ = pre.prepare(img, title)
+        pre_lines = recognize_lines(prepared)
+        pre_ms = (time.perf_counter() - t0) * 1000
+        raw_len = len(" ".join(t for t, _ in raw_lines))
+        pre_len = len(" ".join(t for t, _ in pre_lines))
+        tot_raw_ms += raw_ms
+        tot_pre_ms += pre_ms
+        tot_raw_len += raw_len
+        tot_pre_len += pre_len
+        print(f"{f.name[:40]:40s} {raw_ms:8.1f} {pre_ms:8.1f} {raw_len:10d} {pre_len:10d}")
+    n = len(files)
+    print(f"{'mean':40s} {tot_raw_ms / n:8.1f} {tot_pre_ms / n:8.1f} {tot_raw_len // n:10d} {tot_pre_len // n:10d}")
 
 
 def check_relevant(text: str, title: str, keywords: List[str]) -> bool:
@@ -208,6 +293,8 @@ def main():
     parser.add_argument("--log-json", action="store_true", help="Write JSONL records for each OCR cycle to buddy_mvp/ocr.jsonl")
     parser.add_argument("--retain-days", type=int, default=7, help="Delete screenshots older than this many days (0 = keep forever)")
     parser.add_argument("--idle-threshold", type=int, default=300, help="Seconds of user inactivity before OCR pauses")
+    parser.add_argument("--no-preprocess", action="store_true", help="Feed the full window to OCR (skip crop/downscale/masking)")
+    parser.add_argument("--bench-ocr", type=str, default="", help="Compare raw vs. preprocessed OCR on the PNGs in this folder, then exit")
     args = parser.parse_args()
 
     # ---------------------------------------------------------------------
@@ -254,6 +341,10 @@ def main():
     log_json = _get("log_json", args.log_json, bool)
     retain_days = _get("retain_days", args.retain_days, int)
     idle_threshold = _get("idle_threshold", args.idle_threshold, int)
+    pre_cfg = dict(cfg.get("preprocess", {}))
+    if args.no_preprocess:
+        pre_cfg["enabled"] = False
+    preprocessor = preprocess.Preprocessor(pre_cfg)
 
     model_code = args.model
 
@@ -287,6 +378,10 @@ def main():
                 pass
         logger.addHandler(_console)
 
+    if args.bench_ocr:
+        bench_ocr(Path(args.bench_ocr), pre_cfg)
+        return
+
     # ---------------- Load TASK description ----------------
     user_data_dir = Path(__file__).with_name('user_data')
     if not user_data_dir.exists():
@@ -391,7 +486,7 @@ def main():
             continue
 
         try:
-            img, title = grab_active_window()
+            img, title, client_box = grab_active_window()
         except Exception as exc:
             logger.exception("Screenshot failed: %s", exc)
             time.sleep(POLL)
@@ -414,7 +509,14 @@ def main():
         if run_reason:
             cycle_no += 1  # ------------------ counter advance
             try:
-                text = extract_text(img)
+                t0 = time.perf_counter()
+                ocr_img, frame = preprocessor.prepare(img, title, client_box)
+                t1 = time.perf_counter()
+                lines = recognize_lines(ocr_img)
+                prep_ms = (t1 - t0) * 1000
+                ocr_ms = (time.perf_counter() - t1) * 1000
+                preprocessor.observe(title, lines, frame)
+                text = " ".join(t for t, _ in lines)
             except Exception as exc:
                 logger.exception("OCR failed: %s", exc)
                 time.sleep(POLL)
@@ -432,6 +534,10 @@ def main():
                 _c = _CLR.get(run_reason, "")
                 print(f"{_c}[#{cycle_no:04d} {run_reason}] {title}: {preview}{_RESET}")
             logger.info("Reason=%s | WindowTitle: %s | OCR: %s", run_reason, title, preview)
+            logger.info(
+                "Prep %.0f ms + OCR %.0f ms on %dx%d px (window %dx%d) | %d chars",
+                prep_ms, ocr_ms, ocr_img.width, ocr_img.height, img.width, img.height, len(text),
+            )
 
             # ---- LLM relevance ----
             relevance = 50
@@ -483,6 +589,10 @@ def main():
                     "hint": hint,
                     "screenshot": f"screen_{date_str}_{cycle_no:04d}_{time_str}.png",
                     "cost_usd": cost_usd,
+                    "prep_ms": round(prep_ms, 1),
+                    "ocr_ms": round(ocr_ms, 1),
+                    "ocr_chars": len(text),
+                    "ocr_pixels": ocr_img.width * ocr_img.height,
                 }
                 try:
                     json_log_fp.write(json.dumps(record, ensure_ascii=False) + "\n")
@@ -0,0 +1,330 @@
+"""OCR input preprocessing for Shoulder Buddy.
+
+Shrinks each captured window before it reaches the Windows OCR engine:
+crop to the content area, blank out per-application ignore regions,
+downscale high-DPI frames to a target glyph height and optionally
+binarize.  Fewer pixels and less window chrome mean faster OCR and fewer
+tokens sent to the LLM.
+
+Settings live in the ``[preprocess]`` table of ``buddy_config.toml``; see
+``DEFAULTS`` for the available keys.
+"""
+from __future__ import annotations
+
+import logging
+import statistics
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+from PIL import Image, ImageChops, ImageStat
+
+logger = logging.getLogger("shoulder-buddy")
+
+Box = Tuple[int, int, int, int]  # left, top, right, bottom
+
+DEFAULTS: Dict[str, Any] = {
+    "enabled": True,
+    # Drop the title bar / borders drawn by Windows (client area only).
+    "crop_to_client": True,
+    # Extra pixels trimmed off the window: left, top, right, bottom.
+    "crop_margins": [0, 0, 0, 0],
+    # Trim flat-coloured borders around the remaining content.
+    "auto_trim": True,
+    # Desired height (px) of an OCR line box; larger frames are scaled down.
+    "target_glyph_px": 20,
+    # Never shrink below this factor, however large the text is.
+    "min_scale": 0.4,
+    "binarize": False,
+    "binarize_threshold": 0,  # 0 = mean brightness of the frame
+    # Learn ignore regions from edge text that stays put while the rest of
+    # the window changes (e.g. menus while browsing different pages).
+    "learn_regions": False,
+    "learn_frames": 5,  # content changes a line must survive
+    "learn_edge_band": 0.15,  # only lines within this fraction of an edge
+    "recheck_every": 20,  # OCR one unmasked frame per app this often
+    # {"title substring": [[left, top, right, bottom], ...]}; negative
+    # coordinates count from the right/bottom edge of the window and a
+    # right/bottom of 0 means "up to that edge".
+    "ignore_regions": {},
+}
+
+_TRIM_TOLERANCE = 16  # grey levels; ignores JPEG-ish noise in flat borders
+_MAX_LEARNED = 32  # per application
+
+
+class Frame(NamedTuple):
+    """Mapping from a preprocessed image back to the captured window."""
+
+    dx: int
+    dy: int
+    scale: float
+    size: Tuple[int, int]  # original window width, height
+    recheck: bool = False  # learned regions were left unmasked
+
+
+def app_key(title: str) -> str:
+    """Return the application part of a window title ("... - Google Chrome")."""
+    return title.rsplit(" - ", 1)[-1].strip().lower()
+
+
+def _resolve(box, width: int, height: int) -> Box:
+    """Turn a possibly negative (edge-relative) box into absolute pixels."""
+    left, top, right, bottom = (int(v) for v in box)
+    if left < 0:
+        left += width
+    if right <= 0:
+        right += width
+    if top < 0:
+        top += height
+    if bottom <= 0:
+        bottom += height
+    return (
+        max(0, min(left, width)),
+        max(0, min(top, height)),
+        max(0, min(right, width)),
+        max(0, min(bottom, height)),
+    )
+
+
+def _trim_box(img) -> Box | None:
+    """Bounding box of *img* without borders matching its top-left pixel."""
+    bg = Image.new(img.mode, img.size, img.getpixel((0, 0)))
+    diff = ImageChops.difference(img, bg)
+    mask = diff.point([0] * (_TRIM_TOLERANCE + 1) + [255] * (255 - _TRIM_TOLERANCE))
+    return mask.getbbox()
+
+
+def _validate(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Coerce/clamp config values, falling back to defaults on bad input."""
+
+    def _num(name: str, cast, lo, hi):
+        try:
+            value = cast(cfg[name])
+        except (TypeError, ValueError):
+            logger.warning("preprocess.%s=%r is not a number; using %r", name, cfg[name], DEFAULTS[name])
+            return DEFAULTS[name]
+        clamped = max(lo, min(hi, value))
+        if clamped != value:
+            logger.warning("preprocess.%s=%r out of range [%s, %s]; using %r", name, value, lo, hi, clamped)
+        return clamped
+
+    def _bool(name: str) -> bool:
+        value = cfg[name]
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, int) and value in (0, 1):
+            return bool(value)
+        if isinstance(value, str) and value.strip().lower() in ("true", "yes", "on", "1", "false", "no", "off", "0"):
+            return value.strip().lower() in ("true", "yes", "on", "1")
+        logger.warning("preprocess.%s=%r is not a boolean; using %r", name, value, DEFAULTS[name])
+        return DEFAULTS[name]
+
+    for name in ("enabled", "crop_to_client", "auto_trim", "binarize", "learn_regions"):
+        cfg[name] = _bool(name)
+
+    cfg["target_glyph_px"] = _num("target_glyph_px", float, 1.0, 1000.0)
+    cfg["min_scale"] = _num("min_scale", float, 0.05, 1.0)
+    cfg["binarize_threshold"] = _num("binarize_threshold", int, 0, 255)
+    cfg["learn_frames"] = _num("learn_frames", int, 1, 1000)
+    cfg["learn_edge_band"] = _num("learn_edge_band", float, 0.0, 0.5)
+    cfg["recheck_every"] = _num("recheck_every", int, 1, 100000)
+
+    try:
+        margins = [int(v) for v in cfg["crop_margins"]]
+        if len(margins) != 4:
+            raise ValueError
+    except (TypeError, ValueError):
+        logger.warning("preprocess.crop_margins=%r must be 4 integers; ignoring", cfg["crop_margins"])
+        margins = [0, 0, 0, 0]
+    cfg["crop_margins"] = margins
+
+    regions: Dict[str, List[Box]] = {}
+    if not isinstance(cfg["ignore_regions"], dict):
+        logger.warning("preprocess.ignore_regions must be a table; ignoring")
+        cfg["ignore_regions"] = {}
+    for pattern, boxes in cfg["ignore_regions"].items():
+        valid: List[Box] = []
+        for box in boxes if isinstance(boxes, list) else [boxes]:
+            try:
+                if len(box) != 4:
+                    raise ValueError
+                valid.append(tuple(int(v) for v in box))  # type: ignore[arg-type]
+            except (TypeError, ValueError):
+                logger.warning("preprocess.ignore_regions[%r]: %r is not [left, top, right, bottom]; ignoring", pattern, box)
+        regions[str(pattern)] = valid
+    cfg["ignore_regions"] = regions
+    return cfg
+
+
+class Preprocessor:
+    """Stateful OCR preprocessing stage.
+
+    ``prepare`` is called on every captured frame, ``observe`` with the OCR
+    lines it produced so the glyph size and stable chrome text of each
+    application can be learned over time.
+    """
+
+    def __init__(self, cfg: Dict[str, Any] | None = None):
+        self.cfg: Dict[str, Any] = _validate({**DEFAULTS, **(cfg or {})})
+        self._glyph_px: Dict[str, float] = {}
+        self._seen: Dict[str, Dict[Tuple[str, Box], int]] = {}
+        self._content: Dict[str, frozenset] = {}
+        self._learned: Dict[str, List[Tuple[Box, str]]] = {}
+        self._frames: Dict[str, int] = {}
+
+    def _regions(self, title: str, with_learned: bool = True) -> List[Any]:
+        regions: List[Any] = []
+        lowered = title.lower()
+        for pattern, boxes in self.cfg["ignore_regions"].items():
+            if pattern.lower() in lowered:
+                regions.extend(boxes)
+        if with_learned:
+            regions.extend(box for box, _ in self._learned.get(app_key(title), []))
+        return regions
+
+    def prepare(self, img, title: str, client_box: Box | None = None):
+        """Return ``(image, Frame)`` ready for ``pil_to_software_bitmap``."""
+        width, height = img.size
+        if not self.cfg["enabled"]:
+            return img, Frame(0, 0, 1.0, (width, height))
+
+        gray = img.convert("L")
+
+        # Every ``recheck_every`` frames of an app, leave learned regions
+        # unmasked so ``observe`` can drop the ones whose text moved away.
+        key = app_key(title)
+        recheck = False
+        if self._learned.get(key):
+            self._frames[key] = self._frames.get(key, 0) + 1
+            recheck = self._frames[key] % self.cfg["recheck_every"] == 0
+
+        # 1. Blank ignored regions with their own median colour so the OCR
+        #    engine sees a flat surface (and auto-trim can drop it at edges).
+        for region in self._regions(title, with_learned=not recheck):
+            box = _resolve(region, width, height)
+            if box[0] >= box[2] or box[1] >= box[3]:
+                continue
+            fill = int(ImageStat.Stat(gray.crop(box)).median[0])
+            gray.paste(fill, box)
+
+        # 2. Crop to the content area.
+        left, top, right, bottom = 0, 0, width, height
+        if client_box and self.cfg["crop_to_client"]:
+            left, top, right, bottom = _resolve(client_box, width, height)
+        m_left, m_top, m_right, m_bottom = self.cfg["crop_margins"]
+        left, top = left + m_left, top + m_top
+        right, bottom = right - m_right, bottom - m_bottom
+        if right - left < 8 or bottom - top < 8:
+            left, top, right, bottom = 0, 0, width, height
+        out = gray.crop((left, top, right, bottom))
+        if self.cfg["auto_trim"]:
+            trim = _trim_box(out)
+            if trim and trim != (0, 0) + out.size:
+                out = out.crop(trim)
+                left, top = left + trim[0], top + trim[1]
+
+        # 3. Downscale so text lands near the target glyph height.
+        scale = 1.0
+        glyph = self._glyph_px.get(key)
+        if glyph:
+            scale = max(float(self.cfg["min_scale"]), min(1.0, self.cfg["target_glyph_px"] / glyph))
+            if scale < 0.95:
+                size = (max(1, round(out.width * scale)), max(1, round(out.height * scale)))
+                out = out.resize(size, Image.Resampling.LANCZOS)
+            else:
+                scale = 1.0
+
+        # 4. Optional binarization (keeps mode "L" for the Gray8 bitmap).
+        if self.cfg["binarize"]:
+            threshold = self.cfg["binarize_threshold"] or int(ImageStat.Stat(out).mean[0])
+            out = out.point([0] * (threshold + 1) + [255] * (255 - threshold))
+
+        return out, Frame(left, top, scale, (width, height), recheck)
+
+    def observe(self, title: str, lines: List[Tuple[str, Box]], frame: Frame) -> None:
+        """Learn glyph height and stable chrome text from OCR *lines*.
+
+        *lines* are ``(text, box)`` pairs in the coordinates of the image
+        returned by ``prepare``.
+        """
+        key = app_key(title)
+        orig: List[Tuple[str, Box]] = []
+        for text, (l, t, r, b) in lines:
+            orig.append((
+                text,
+                (
+                    round(l / frame.scale) + frame.dx,
+                    round(t / frame.scale) + frame.dy,
+                    round(r / frame.scale) + frame.dx,
+                    round(b / frame.scale) + frame.dy,
+                ),
+            ))
+
+        # Only full-resolution frames may raise the glyph estimate: small
+        # text lost after downscaling drops out of the median and would
+        # otherwise push the scale further down every cycle.
+        heights = [b - t for _, (_, t, _, b) in orig if b > t]
+        if len(heights) >= 3:
+            glyph = statistics.median(heights)
+            if frame.scale < 1.0 and key in self._glyph_px:
+                glyph = min(glyph, self._glyph_px[key])
+            self._glyph_px[key] = glyph
+
+        if frame.recheck:
+            self._recheck(key, orig, frame.size)
+        if self.cfg["learn_regions"]:
+            self._learn(key, orig, frame.size)
+
+    def _at_edge(self, box: Box, size: Tuple[int, int]) -> bool:
+        width, height = size
+        band = self.cfg["learn_edge_band"]
+        l, t, r, b = box
+        return b <= height * band or t >= height * (1 - band) or r <= width * band or l >= width * (1 - band)
+
+    def _recheck(self, key: str, lines: List[Tuple[str, Box]], size: Tuple[int, int]) -> None:
+        """Keep only learned regions whose text still shows up inside them."""
+        width, height = size
+        kept = []
+        for region, text in self._learned.get(key, []):
+            l, t, r, b = _resolve(region, width, height)
+            if any(
+                line == text and l <= (bl + br) / 2 <= r and t <= (bt + bb) / 2 <= b
+                for line, (bl, bt, br, bb) in lines
+            ):
+                kept.append((region, text))
+            else:
+                logger.info("Dropped ignore region for %s: %s (%r)", key or "<untitled>", region, text[:40])
+        self._learned[key] = kept
+
+    def _learn(self, key: str, lines: List[Tuple[str, Box]], size: Tuple[int, int]) -> None:
+        width, height = size
+        band = self.cfg["learn_edge_band"]
+        edge = [(text, box) for text, box in lines if text.strip() and self._at_edge(box, size)]
+        content = frozenset(text for text, box in lines if not self._at_edge(box, size))
+
+        # A line only counts as chrome if it stayed put while the rest of the
+        # window changed; an unchanged frame (idle interval cycle, same page)
+        # says nothing, so counts are carried over without advancing.
+        changed = key in self._content and content != self._content[key]
+        self._content[key] = content
+
+        seen = self._seen.get(key, {})
+        current: Dict[Tuple[str, Box], int] = {}
+        learned = self._learned.setdefault(key, [])
+        for text, (l, t, r, b) in edge:
+            # Snap to an 8 px grid so sub-pixel jitter doesn't reset the count.
+            snapped = (l // 8 * 8, t // 8 * 8, -(-r // 8) * 8, -(-b // 8) * 8)
+            ident = (text, snapped)
+            current[ident] = seen.get(ident, 0) + (1 if changed else 0)
+            if changed and current[ident] == self.cfg["learn_frames"] and len(learned) < _MAX_LEARNED:
+                # Store right/bottom-edge regions relative to that edge so
+                # they survive window resizes.
+                sl, st, sr, sb = snapped
+                if sl >= width * (1 - band):
+                    sl, sr = sl - width, min(sr - width, 0)
+                if st >= height * (1 - band):
+                    st, sb = st - height, min(sb - height, 0)
+                if ((sl, st, sr, sb), text) in learned:
+                    continue
+                learned.append(((sl, st, sr, sb), text))
+                logger.info("Learned ignore region for %s: %s (%r)", key or "<untitled>", (sl, st, sr, sb), text[:40])
+        self._seen[key] = current
@@ -0,0 +1,151 @@
+from PIL import Image, ImageDraw
+
+from buddy_mvp import preprocess
+from buddy_mvp.preprocess import Frame, Preprocessor, _resolve
+
+TITLE = "Some page - Test App"
+
+
+def _window(size=(400, 300), bg=255):
+    return Image.new("L", size, bg)
+
+
+def test_resolve_negative_and_zero_edges():
+    assert _resolve((10, 20, 30, 40), 400, 300) == (10, 20, 30, 40)
+    # negative left/top count from the far edge, 0 right/bottom = up to it
+    assert _resolve((-100, -50, 0, 0), 400, 300) == (300, 250, 400, 300)
+    assert _resolve((0, 0, -10, 80), 400, 300) == (0, 0, 390, 80)
+    # clamped to the window
+    assert _resolve((-999, 0, 999, 999), 400, 300) == (0, 0, 400, 300)
+
+
+def test_prepare_crops_to_client_area_and_trims():
+    img = _window()
+    ImageDraw.Draw(img).rectangle((0, 0, 399, 29), fill=0)  # title bar
+    ImageDraw.Draw(img).rectangle((100, 120, 199, 159), fill=0)  # content
+    out, frame = Preprocessor().prepare(img, TITLE, client_box=(0, 30, 400, 300))
+    assert out.mode == "L"
+    assert out.size == (100, 40)
+    assert frame == Frame(100, 120, 1.0, (400, 300))
+
+
+def test_prepare_applies_crop_margins():
+    img = _window()
+    pre = Preprocessor({"auto_trim": False, "crop_margins": [5, 10, 15, 20]})
+    out, frame = pre.prepare(img, TITLE)
+    assert out.size == (380, 270)
+    assert (frame.dx, frame.dy) == (5, 10)
+
+
+def test_prepare_downscales_to_target_glyph_height():
+    pre = Preprocessor({"auto_trim": False, "target_glyph_px": 20})
+    lines = [("a", (0, 0, 50, 40)), ("b", (0, 50, 50, 90)), ("c", (0, 100, 50, 140))]
+    pre.observe(TITLE, lines, Frame(0, 0, 1.0, (400, 300)))
+    out, frame = pre.prepare(_window(), TITLE)
+    assert frame.scale == 0.5
+    assert out.size == (200, 150)
+
+
+def test_observe_maps_scaled_boxes_back_to_window():
+    pre = Preprocessor({"target_glyph_px": 20})
+    frame = Frame(100, 30, 0.5, (400, 300))
+    # 10 px tall lines at half scale are 20 px in the window: no more scaling
+    lines = [("a", (0, 0, 20, 10)), ("b", (0, 20, 20, 30)), ("c", (0, 40, 20, 50))]
+    pre.observe(TITLE, lines, frame)
+    assert pre._glyph_px["test app"] == 20
+
+    pre = Preprocessor({"learn_regions": True, "learn_frames": 1})
+    pre.observe(TITLE, [("Menu", (0, 0, 20, 5)), ("page one", (100, 100, 200, 110))], frame)
+    pre.observe(TITLE, [("Menu", (0, 0, 20, 5)), ("page two", (100, 100, 200, 110))], frame)
+    # (0, 0, 20, 5) / 0.5 + (100, 30) = (100, 30, 140, 40), snapped to 8 px
+    assert pre._learned["test app"] == [((96, 24, 144, 40), "Menu")]
+
+
+def test_configured_ignore_regions_are_masked():
+    img = _window()
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((320, 0, 399, 299), fill=128)  # sidebar background
+    draw.rectangle((340, 100, 380, 110), fill=0)  # sidebar text
+    draw.rectangle((50, 50, 100, 60), fill=0)  # content
+    pre = Preprocessor({"auto_trim": False, "ignore_regions": {"test app": [[-80, 0, 0, 0]]}})
+    out, _ = pre.prepare(img, TITLE)
+    assert out.crop((320, 0, 400, 300)).getextrema() == (128, 128)
+    assert out.getpixel((60, 55)) == 0
+    # other applications are untouched
+    out, _ = pre.prepare(img, "Other window")
+    assert out.getpixel((350, 105)) == 0
+
+
+def _observe(pre, content, size=(400, 300)):
+    menu = ("File Edit View", (8, 8, 120, 24))
+    pre.observe(TITLE, [menu, (content, (100, 140, 300, 160))], Frame(0, 0, 1.0, size))
+
+
+def test_learning_requires_content_changes():
+    pre = Preprocessor({"learn_regions": True, "learn_frames": 2})
+    # Same page for many cycles: nothing is learned
+    for _ in range(5):
+        _observe(pre, "page one")
+    assert not pre._learned.get("test app")
+    # Menu survives two content changes -> learned
+    _observe(pre, "page two")
+    assert not pre._learned.get("test app")
+    _observe(pre, "page three")
+    assert pre._learned["test app"] == [((8, 8, 120, 24), "File Edit View")]
+
+
+def test_learned_regions_are_rechecked_and_dropped():
+    pre = Preprocessor({"learn_regions": True, "learn_frames": 1, "recheck_every": 2, "auto_trim": False})
+    _observe(pre, "page one")
+    _observe(pre, "page two")
+    assert pre._learned["test app"]
+    _, frame = pre.prepare(_window(), TITLE)
+    assert not frame.recheck
+    _, frame = pre.prepare(_window(), TITLE)
+    assert frame.recheck
+    # The menu text is gone from the unmasked frame, so the region expires
+    pre.observe(TITLE, [("page three", (100, 140, 300, 160))], frame)
+    assert pre._learned["test app"] == []
+
+
+def test_invalid_config_is_clamped():
+    pre = Preprocessor({"binarize": True, "binarize_threshold": 300, "crop_margins": [1, 2]})
+    assert pre.cfg["binarize_threshold"] == 255
+    assert pre.cfg["crop_margins"] == [0, 0, 0, 0]
+    out, _ = pre.prepare(_window(), TITLE)
+    assert out.mode == "L"
+    assert preprocess.DEFAULTS["crop_margins"] == [0, 0, 0, 0]
+
+
+def test_relearned_region_is_not_duplicated():
+    pre = Preprocessor({"learn_regions": True, "learn_frames": 1, "recheck_every": 2, "auto_trim": False})
+    for n in range(8):
+        _, frame = pre.prepare(_window(), TITLE)
+        # The menu is only visible when learned regions are left unmasked
+        menu = [("File Edit", (8, 8, 120, 24))] if frame.recheck or n < 2 else []
+        pre.observe(TITLE, menu + [(f"page {n}", (100, 140, 300, 160))], frame)
+    assert pre._learned["test app"] == [((8, 8, 120, 24), "File Edit")]
+
+
+def test_boolean_config_values_are_coerced():
+    pre = Preprocessor({"binarize": "false", "auto_trim": "yes", "learn_regions": "maybe"})
+    assert pre.cfg["binarize"] is False
+    assert pre.cfg["auto_trim"] is True
+    assert pre.cfg["learn_regions"] is False
+
+
+def test_glyph_estimate_only_rises_on_full_scale_frames():
+    pre = Preprocessor({"auto_trim": False})
+    tall = [("a", (0, 0, 50, 40)), ("b", (0, 50, 50, 90)), ("c", (0, 100, 50, 140))]
+    pre.observe(TITLE, tall, Frame(0, 0, 1.0, (400, 300)))
+    assert pre._glyph_px["test app"] == 40
+    # Downscaled frame where only the large lines survived: 30 px at half
+    # scale is 60 px in the window, but the estimate must not grow.
+    pre.observe(TITLE, [(t, (l, tp // 2, r, tp // 2 + 30)) for t, (l, tp, r, _) in tall], Frame(0, 0, 0.5, (400, 300)))
+    assert pre._glyph_px["test app"] == 40
+    # Smaller text on a downscaled frame may still lower it
+    pre.observe(TITLE, [(t, (l, tp // 2, r, tp // 2 + 15)) for t, (l, tp, r, _) in tall], Frame(0, 0, 0.5, (400, 300)))
+    assert pre._glyph_px["test app"] == 30
+    # A full-resolution frame resets it
+    pre.observe(TITLE, tall, Frame(0, 0, 1.0, (400, 300)))
+    assert pre._glyph_px["test app"] == 40